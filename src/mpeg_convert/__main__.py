@@ -28,7 +28,9 @@ import inspect
 from typing import Any, Dict
 
 from . import utils
+from . import trace
 from . import module
+from . import cluster
 
 from .term import move_caret_newline
 from .arguments import parse_arguments
@@ -50,17 +52,34 @@ def start_module(arguments: Dict[Any, Any]) -> int:
         if arg_config:
             module.config()
             return 0
+    if len(arguments["module"]) == 3 and arguments["module"][0] == "thumbnails":
+        module.thumbnails(arguments)
+        return 0
+    if len(arguments["module"]) >= 4 and arguments["module"][0] == "join":
+        module.join(arguments)
+        return 0
+    if len(arguments["module"]) == 4 and arguments["module"][0] == "enqueue":
+        cluster.enqueue(arguments)
+        return 0
+    if len(arguments["module"]) == 2 and arguments["module"][0] == "worker":
+        cluster.work(arguments)
+        return 0
     if len(arguments["module"]) == 2:
         module.convert(arguments)
         return 0
     raise ArgumentsError("use '--help' for usage info", code=127)
 
 
-def main() -> int:
+def run() -> int:
+    """Runs the program, reporting any errors to the console. Returns the exit code"""
     try:
         arguments = parse_arguments(sys.argv)
-        utils.initialize(arguments)
-        return start_module(arguments)
+        if arguments["trace"]:
+            trace.enable(utils.expand_paths(arguments["trace"]))
+        with trace.span("initialize"):
+            utils.initialize(arguments)
+        with trace.span("run", module=arguments["module"]):
+            return start_module(arguments)
     except KeyboardInterrupt:
         move_caret_newline()
         utils.console.print(f" • mpeg-convert received keyboard interrupt", style="tan")
@@ -88,5 +107,18 @@ def main() -> int:
         return 255
 
 
+def main() -> int:
+    exit_code = run()
+    try:
+        # Saved regardless of the outcome, as traces of failed runs are useful too
+        trace.save()
+    except ForceExit as e:
+        utils.console.print(f" • mpeg-convert has been interrupted because {e.reason}", style="red")
+        if exit_code == 0:
+            utils.console.print(f" • mpeg-convert terminating with exit code {e.exit_code}", style="red")
+            return e.exit_code
+    return exit_code
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import hashlib
+
+from typing import Any, Dict, List, Union
+
+from . import trace
+from .utils import console, expand_paths, ROOT_PATH
+from .backend import execute_ffmpeg
+from .metadata import Metadata
+from .exceptions import ForceExit
+
+from ffmpeg import FFmpeg
+
+# Analysis passes decode the whole input, so their results are cached in
+# CACHE_PATH keyed by a fingerprint of the input and the parameters of the
+# analysis. Converting the same input again (even with another preset that
+# uses the same analysis) then skips the analysis pass entirely
+CACHE_PATH = ROOT_PATH + "cache/"
+FINGERPRINT_BYTES = 1024 * 1024
+
+# The order the analyses are run in. Cropping changes the video that is
+# measured by the first pass of a two-pass encode, so it has to come first
+ANALYSES = ["cropdetect", "loudnorm", "two-pass"]
+DEFAULT_PARAMETERS = {
+    "cropdetect": "",
+    "loudnorm": "I=-16:TP=-1.5:LRA=11",
+    "two-pass": ""
+}
+
+
+def get_fingerprint(input_path: str) -> Dict[str, Any]:
+    """Gets a fingerprint identifying the content of the input. Besides the
+    size and modification time, the first and last megabyte of the file are
+    hashed so that a replaced file with the same size is not mistaken for the
+    original one
+    """
+    size = os.path.getsize(input_path)
+    digest = hashlib.sha256()
+    with open(input_path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        f.seek(max(0, size - FINGERPRINT_BYTES))
+        digest.update(f.read(FINGERPRINT_BYTES))
+    return {
+        "path": os.path.realpath(input_path),
+        "size": size,
+        "mtime": os.path.getmtime(input_path),
+        "digest": digest.hexdigest()
+    }
+
+
+def get_cache_key(fingerprint: Dict[str, Any], name: str, parameters: Any) -> str:
+    """Gets the key the result of an analysis is cached under"""
+    content = json.dumps([fingerprint, name, parameters], sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def load_cached(key: str) -> Any:
+    """Loads a cached analysis result, or returns None if there is none"""
+    path = expand_paths(CACHE_PATH + key + ".json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_cached(key: str, result: Any) -> None:
+    """Caches the result of an analysis"""
+    path = expand_paths(CACHE_PATH + key + ".json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(result, f)
+    os.replace(path + ".tmp", path)
+    return
+
+
+def run_pass(instance: FFmpeg) -> List[str]:
+    """Runs an analysis pass and returns the lines ffmpeg printed to stderr,
+    which is where ffmpeg's filters print their measurements
+    """
+    lines: List[str] = []
+    instance.on("stderr", lambda line: lines.append(line))
+    execute_ffmpeg(instance)
+    return lines
+
+
+def join_filters(first: str, second: Any) -> str:
+    """Joins two filter chains, ignoring the second one if it is empty"""
+    if second is None or second == "":
+        return first
+    return f"{first},{second}"
+
+
+def measure_crop(input_path: str, parameters: str) -> str:
+    """Runs cropdetect over the input and returns the last detected crop area
+    (e.g. 1920:800:0:140)
+    """
+    cropdetect = f"cropdetect={parameters}" if parameters else "cropdetect"
+    lines = run_pass(
+        FFmpeg()
+        .input(input_path)
+        .output("-", {"an": None, "vf": cropdetect, "f": "null"})
+    )
+    areas = [match.group(1) for line in lines for match in re.finditer(r"crop=(\d+:\d+:\d+:\d+)", line)]
+    if not areas:
+        raise ForceExit("cropdetect did not detect a crop area")
+    return areas[-1]
+
+
+def measure_loudness(input_path: str, parameters: str) -> Dict[str, str]:
+    """Runs the measurement pass of loudnorm over the input and returns the
+    measured values
+    """
+    lines = run_pass(
+        FFmpeg()
+        .input(input_path)
+        .output("-", {"vn": None, "af": f"loudnorm={parameters}:print_format=json", "f": "null"})
+    )
+    output = "\n".join(lines)
+    start = output.rfind("{")
+    end = output.rfind("}")
+    if start == -1 or end < start:
+        raise ForceExit("loudnorm did not report any measurements")
+    return json.loads(output[start:end + 1])
+
+
+def get_sample_rate(input_path: str) -> Union[str, None]:
+    """Gets the sample rate of the first audio stream of the input, or None if
+    the input does not have any audio streams
+    """
+    for stream in Metadata(input_path).metadata["streams"]:
+        if stream.get("codec_type") == "audio" and "sample_rate" in stream:
+            return stream["sample_rate"]
+    return None
+
+
+def run_first_pass(input_path: str, options: Dict, passlogfile: str) -> None:
+    """Runs the first pass of a two-pass encode, writing the stats of the
+    encoder to files starting with `passlogfile`
+    """
+    first_pass = dict(options)
+    first_pass.update({"pass": 1, "passlogfile": passlogfile, "an": None, "f": "null"})
+    run_pass(
+        FFmpeg()
+        .option("y")
+        .input(input_path)
+        .output("-", first_pass)
+    )
+    return
+
+
+def apply_analysis(input_path: str, options: Dict, analysis: Dict[str, str]) -> Dict:
+    """Runs (or loads from the cache) the analyses of a preset and injects the
+    measured values into the options. Returns the new options
+    """
+    for name in analysis:
+        if name not in ANALYSES:
+            raise ForceExit(f"unknown analysis '{name}' in preset")
+
+    options = dict(options)
+    fingerprint = get_fingerprint(input_path)
+    for name in [name for name in ANALYSES if name in analysis]:
+        parameters = analysis[name] or DEFAULT_PARAMETERS[name]
+        # The first pass of a two-pass encode depends on the encoder options,
+        # so they are part of the key as well
+        key = get_cache_key(fingerprint, name, [parameters, options] if name == "two-pass" else parameters)
+        result = load_cached(key)
+        if name == "two-pass" and result is not None and not os.path.exists(f"{result}-0.log"):
+            result = None   # The stats files of the first pass have been removed
+        if result is not None:
+            console.print(f" • using cached {name} analysis")
+        else:
+            console.print(f" • running {name} analysis pass")
+            with trace.span("analysis", analysis=name):
+                if name == "cropdetect":
+                    result = measure_crop(input_path, parameters)
+                if name == "loudnorm":
+                    result = measure_loudness(input_path, parameters)
+                if name == "two-pass":
+                    result = expand_paths(CACHE_PATH + key)
+                    os.makedirs(os.path.dirname(result), exist_ok=True)
+                    run_first_pass(input_path, options, result)
+            save_cached(key, result)
+
+        if name == "cropdetect":
+            options["vf"] = join_filters(f"crop={result}", options.get("vf"))
+        if name == "loudnorm":
+            loudnorm = (
+                f"loudnorm={parameters}"
+                f":measured_I={result['input_i']}"
+                f":measured_TP={result['input_tp']}"
+                f":measured_LRA={result['input_lra']}"
+                f":measured_thresh={result['input_thresh']}"
+                f":offset={result['target_offset']}"
+                f":linear=true"
+            )
+            # loudnorm falls back to dynamic mode when linear mode cannot reach
+            # the target, and dynamic mode always outputs 192 kHz audio. The
+            # input sample rate is restored unless the preset sets its own
+            sample_rate = get_sample_rate(input_path)
+            if sample_rate is not None and "ar" not in options and "ar:a" not in options:
+                loudnorm += f",aresample={sample_rate}"
+            options["af"] = join_filters(loudnorm, options.get("af"))
+        if name == "two-pass":
+            options["pass"] = 2
+            options["passlogfile"] = result
+    return options
@@ -1,6 +1,13 @@
+import sys
+
 from typing import Any, Dict, List, Union, Tuple
 from .exceptions import ArgumentsError
 
+# The values used when a flag taking an optional value is specified without one
+DEFAULT_THUMBNAILS = 100
+DEFAULT_SPRITE = (10, 10)
+DEFAULT_SEGMENT_SECS = 300
+
 
 class ArgumentFlag:
     """A flag encountered during the parsing of arguments"""
@@ -39,6 +46,36 @@ def process_bool_flag(value: str) -> Union[int, str]:
     return bool(int(value))
 
 
+def process_int_flag(flag: str, value: Any, default: int) -> int:
+    """Converts a flag taking a positive integer into an integer. A bare flag
+    (without a value) uses the default
+    """
+    if value is True:
+        return default
+    if not is_int(value) or int(value) == 0:
+        raise ArgumentsError(f"invalid value '{value}' for '{flag}'", code=126)
+    return int(value)
+
+
+def process_layout_flag(flag: str, value: Any) -> Tuple[int, int]:
+    """Converts a flag taking a layout (e.g. 10x10) into columns and rows"""
+    split = str(value).lower().split("x")
+    if len(split) != 2 or not all(is_int(item) and int(item) > 0 for item in split):
+        raise ArgumentsError(f"invalid value '{value}' for '{flag}'", code=126)
+    return (int(split[0]), int(split[1]))
+
+
+def process_choice_flag(flag: str, value: Any, choices: List[str]) -> str:
+    """Converts a flag taking one of several choices into the (lowercase)
+    choice. A bare flag (without a value) uses the first choice
+    """
+    if value is True:
+        return choices[0]
+    if not isinstance(value, str) or value.lower() not in choices:
+        raise ArgumentsError(f"invalid value '{value}' for '{flag}'", code=126)
+    return value.lower()
+
+
 def is_stacked_flag(flag: str) -> bool:
     """Whether an argument is a stacked flag (e.g. -abc)"""
     return len(flag) >= 2 and \
@@ -99,6 +136,14 @@ def parse_arguments(argv: List[str]) -> Dict[str, Any]:
         "config": False,
         "preset": False,
         "plain": False,
+        "thumbnails": False,
+        "sprite": False,
+        "watch": False,
+        "resume": False,
+        "verify": False,
+        "samples": 8,
+        "trace": False,
+        "backend": "ffmpeg",
         "version": False,
         "help": False
     }
@@ -110,6 +155,39 @@ def parse_arguments(argv: List[str]) -> Dict[str, Any]:
         if flag.arg == "--preset":
             parsed_arguments["preset"] = flag.val
             continue
+        if flag.arg == "--thumbnails":
+            parsed_arguments["thumbnails"] = process_int_flag(flag.arg, flag.val, DEFAULT_THUMBNAILS)
+            continue
+        if flag.arg == "--sprite":
+            parsed_arguments["sprite"] = process_layout_flag(flag.arg, flag.val)
+            continue
+        if flag.arg == "--watch":
+            parsed_arguments["watch"] = process_bool_flag(flag.val)
+            continue
+        if flag.arg == "--resume":
+            parsed_arguments["resume"] = process_int_flag(flag.arg, flag.val, DEFAULT_SEGMENT_SECS)
+            continue
+        if flag.arg == "--verify":
+            parsed_arguments["verify"] = process_choice_flag(flag.arg, flag.val, ["sampled", "full"])
+            continue
+        if flag.arg == "--samples":
+            if flag.val is True:
+                raise ArgumentsError("'--samples' requires a number", code=126)
+            parsed_arguments["samples"] = process_int_flag(flag.arg, flag.val, 0)
+            continue
+        if flag.arg == "--trace":
+            if flag.val is True:
+                raise ArgumentsError("'--trace' requires a file path", code=126)
+            parsed_arguments["trace"] = flag.val
+            continue
+        if flag.arg == "--backend":
+            if flag.val is True:
+                raise ArgumentsError("'--backend' requires a backend", code=126)
+            parsed_arguments["backend"] = process_choice_flag(flag.arg, flag.val, ["ffmpeg", "pipe"])
+            if parsed_arguments["backend"] == "pipe" and sys.platform == "win32":
+                # Windows cannot wait on pipes with select()
+                raise ArgumentsError("the 'pipe' backend is not supported on windows", code=126)
+            continue
         if flag.arg == "--config":
             parsed_arguments["config"] = process_bool_flag(flag.val)
             continue
@@ -0,0 +1,286 @@
+import os
+import selectors
+import threading
+import subprocess
+
+from typing import Any, Callable, Deque, Dict, List, Set, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import trace
+
+from ffmpeg import FFmpeg, FFmpegError
+
+# The execution backends (see the '--backend' flag): "ffmpeg" runs ffmpeg
+# through python-ffmpeg, which parses the human-readable stderr of ffmpeg with
+# a few threads per process. "pipe" spawns ffmpeg directly with '-progress
+# pipe:1 -nostats' and reads the compact key=value progress of any number of
+# processes in a single thread.
+#
+# The number of stderr lines kept per process for error reporting
+STDERR_LINES = 32
+READ_SIZE = 65536
+
+ProgressCallback = Callable[[Dict[str, str]], None]
+
+# The ffmpeg instances and processes currently running, so that they can be
+# stopped from another thread with `terminate_all()`
+_running: Set[Any] = set()
+_lock = threading.Lock()
+_terminated = threading.Event()
+
+
+def start_running(item: Any, arguments: List[str]) -> None:
+    """Registers an instance or process that is about to run. Raises an
+    FFmpegError if execution has been terminated with `terminate_all()`
+    """
+    with _lock:
+        if _terminated.is_set():
+            raise FFmpegError.create("ffmpeg was terminated", arguments)
+        _running.add(item)
+    return
+
+
+def stop_running(item: Any) -> None:
+    """Unregisters an instance or process that is no longer running"""
+    with _lock:
+        _running.discard(item)
+    return
+
+
+def terminate_all() -> None:
+    """Terminates every running ffmpeg process. Starting ffmpeg fails from
+    then on until `reset_terminated()` is called
+    """
+    with _lock:
+        _terminated.set()
+        for item in _running:
+            try:
+                item.terminate()
+            except FFmpegError:
+                pass   # The instance has not spawned its process yet
+    return
+
+
+def reset_terminated() -> None:
+    """Allows ffmpeg to be started again after `terminate_all()`"""
+    _terminated.clear()
+    return
+
+
+def build_arguments(instance: FFmpeg) -> List[str]:
+    """Gets the arguments of an ffmpeg instance, with the progress of ffmpeg
+    reported to stdout as key=value pairs instead of to stderr
+    """
+    arguments = instance.arguments
+    return [arguments[0], "-nostats", "-progress", "pipe:1", *arguments[1:]]
+
+
+def get_frame(progress: Dict[str, str]) -> int:
+    """Gets the number of frames processed from a block of progress. Outputs
+    without a video stream do not report frames, in which case 0 is returned
+    """
+    frame = progress.get("frame", "0")
+    return int(frame) if frame.isdigit() else 0
+
+
+class Process:
+    """An ffmpeg process whose output is read by `run_all()`"""
+
+    def __init__(
+        self,
+        instance: FFmpeg,
+        on_progress: Union[ProgressCallback, None] = None
+    ) -> None:
+        """Initializes an instance of `Process`. The process is not spawned
+        until `start()` is called
+        """
+        self.arguments = build_arguments(instance)
+        self.on_progress = on_progress
+        self.progress: Dict[str, str] = {}
+        self.stderr: Deque[str] = deque(maxlen=STDERR_LINES)
+        self.returncode: Union[int, None] = None
+        self._popen: Union[subprocess.Popen, None] = None
+        self._started = 0.0
+        self._buffers: Dict[str, bytes] = {"stdout": b"", "stderr": b""}
+        return
+
+    def start(self) -> None:
+        """Spawns the ffmpeg process"""
+        trace.instant("spawn ffmpeg", arguments=self.arguments)
+        self._started = trace.now()
+        start_running(self, self.arguments)
+        self._popen = subprocess.Popen(
+            self.arguments,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        return
+
+    def terminate(self) -> None:
+        """Terminates the ffmpeg process if it has been spawned"""
+        if self._popen is not None:
+            self._popen.terminate()
+        return
+
+    def feed(self, name: str, data: bytes) -> None:
+        """Handles data read from stdout or stderr. Only complete lines are
+        handled, and the rest is kept until more data arrives
+        """
+        lines = (self._buffers[name] + data).split(b"\n")
+        self._buffers[name] = lines.pop()
+        for line in lines:
+            self.handle_line(name, line.decode(errors="replace").strip())
+        return
+
+    def handle_line(self, name: str, line: str) -> None:
+        """Handles a single line of output. Progress is reported in blocks of
+        key=value lines that end with a 'progress' key
+        """
+        if name == "stderr":
+            if line:
+                self.stderr.append(line)
+            return
+        key, _, value = line.partition("=")
+        self.progress[key] = value
+        if key == "progress" and self.on_progress is not None:
+            self.on_progress(self.progress)
+        return
+
+    def finish(self) -> None:
+        """Waits for the process to exit once both of its pipes are closed"""
+        for name in self._buffers:
+            if self._buffers[name]:
+                self.handle_line(name, self._buffers[name].decode(errors="replace").strip())
+                self._buffers[name] = b""
+        assert self._popen is not None
+        self.returncode = self._popen.wait()
+        stop_running(self)
+        # Processes share the thread that reads them, so each one is traced
+        # on a track of its own (keyed by the pid of the process)
+        trace.complete("ffmpeg", self._started, tid=self._popen.pid, arguments=self.arguments)
+        return
+
+    def check(self) -> None:
+        """Raises an FFmpegError if the process failed, with the last line
+        ffmpeg printed to stderr as the message
+        """
+        if self.returncode != 0:
+            message = self.stderr[-1] if self.stderr else f"ffmpeg exited with code {self.returncode}"
+            raise FFmpegError.create(message, self.arguments)
+        return
+
+
+def run_all(processes: List[Process], jobs: Union[int, None] = None) -> None:
+    """Runs the processes, at most `jobs` (the number of cpus by default) at
+    a time. The output of every running process is multiplexed in the calling
+    thread with a selector, so no threads are used regardless of the number
+    of processes. Use `Process.check()` afterwards to check for failures
+    """
+    jobs = jobs or os.cpu_count() or 1
+    waiting = list(reversed(processes))
+    open_pipes: Dict[Process, int] = {}
+    selector = selectors.DefaultSelector()
+
+    def start_next() -> None:
+        """Spawns the next waiting process and registers its pipes"""
+        process = waiting.pop()
+        process.start()
+        assert process._popen is not None
+        selector.register(process._popen.stdout, selectors.EVENT_READ, (process, "stdout")) # type: ignore
+        selector.register(process._popen.stderr, selectors.EVENT_READ, (process, "stderr")) # type: ignore
+        open_pipes[process] = 2
+
+    try:
+        while waiting and len(open_pipes) < jobs:
+            start_next()
+        while open_pipes:
+            for key, _ in selector.select():
+                process, name = key.data
+                data = os.read(key.fd, READ_SIZE)
+                if data:
+                    process.feed(name, data)
+                    continue
+                selector.unregister(key.fileobj)
+                key.fileobj.close() # type: ignore
+                open_pipes[process] -= 1
+                if open_pipes[process] > 0:
+                    continue
+                del open_pipes[process]
+                process.finish()
+                if waiting:
+                    start_next()
+    finally:
+        for process in open_pipes:
+            assert process._popen is not None
+            process._popen.kill()
+            process._popen.wait()
+            stop_running(process)
+        selector.close()
+    return
+
+
+def run(instance: FFmpeg, on_progress: Union[ProgressCallback, None] = None) -> None:
+    """Runs a single ffmpeg instance with the pipe backend. Raises an
+    FFmpegError if ffmpeg failed
+    """
+    process = Process(instance, on_progress)
+    run_all([process])
+    process.check()
+    return
+
+
+def execute_ffmpeg(instance: FFmpeg) -> None:
+    """Runs a single ffmpeg instance through python-ffmpeg. Raises an
+    FFmpegError if ffmpeg failed or was terminated with `terminate_all()`
+    """
+    start_running(instance, instance.arguments)
+    try:
+        instance.execute()
+    finally:
+        stop_running(instance)
+    if _terminated.is_set():
+        # python-ffmpeg returns normally when the process is terminated
+        raise FFmpegError.create("ffmpeg was terminated", instance.arguments)
+    return
+
+
+def execute(instance: FFmpeg, backend: str) -> None:
+    """Runs a single ffmpeg instance with either backend. Raises an
+    FFmpegError if ffmpeg failed
+    """
+    if backend == "pipe":
+        run(instance)
+        return
+    with trace.span("ffmpeg", arguments=instance.arguments):
+        execute_ffmpeg(instance)
+    return
+
+
+def execute_all(instances: List[FFmpeg], backend: str, jobs: Union[int, None] = None) -> List[Union[FFmpegError, None]]:
+    """Runs independent ffmpeg instances concurrently with either backend.
+    Returns the error raised by each instance, or None if it succeeded
+    """
+    if backend == "pipe":
+        processes = [Process(instance) for instance in instances]
+        run_all(processes, jobs)
+        ret: List[Union[FFmpegError, None]] = []
+        for process in processes:
+            try:
+                process.check()
+                ret.append(None)
+            except FFmpegError as e:
+                ret.append(e)
+        return ret
+
+    def execute_one(instance: FFmpeg) -> Union[FFmpegError, None]:
+        """Runs an instance in a thread of the pool, returning its error"""
+        try:
+            execute(instance, backend)
+        except FFmpegError as e:
+            return e
+        return None
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        return list(executor.map(execute_one, instances))
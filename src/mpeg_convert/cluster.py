@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+
+from typing import Any, Dict, List, Union
+
+from . import trace
+from .utils import console, expand_paths
+from .module import get_preset_options, execute, print_ffmpeg_error
+from .verify import verify_output, print_report
+from .backend import terminate_all, reset_terminated
+from .exceptions import ArgumentsError, ForceExit, exception_name
+
+from ffmpeg import FFmpegError
+
+# A queue is a directory on storage shared by every worker, laid out as
+#
+#     <queue>/pending/<job>.json             jobs waiting to be claimed
+#     <queue>/claimed/<job>.json.<worker>    jobs being worked on (mtime is the lease)
+#     <queue>/done/<job>.json                finished jobs along with their results
+#     <queue>/failed/<job>.json              failed jobs along with the error
+#
+# A job is claimed by renaming it from pending/ to claimed/, which is atomic
+# on local and network filesystems so only a single worker can ever win the
+# rename. The claiming worker touches the claimed job every HEARTBEAT_SECS;
+# a claimed job that has not been touched for LEASE_SECS is considered to
+# belong to a crashed worker and is renamed back into pending/. Claimed jobs
+# are named after the claiming worker, so a worker whose lease was lost can
+# tell (its claimed job is gone) even if another worker claimed the job again
+# in the meantime, and a stale claim can never be mistaken for a fresh one
+QUEUE_DIRS = ["pending", "claimed", "done", "failed"]
+HEARTBEAT_SECS = 10
+LEASE_SECS = 60
+POLL_SECS = 5
+
+
+def get_worker_id() -> str:
+    """Gets an identifier that is unique to this worker process across hosts"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def initialize_queue(queue_path: str) -> None:
+    """Creates the directories of a queue if they do not already exist"""
+    for name in QUEUE_DIRS:
+        os.makedirs(os.path.join(queue_path, name), exist_ok=True)
+    return
+
+
+def write_json(path: str, content: Dict[str, Any]) -> None:
+    """Writes a json file atomically so other workers never read a partially
+    written file
+    """
+    temp_path = f"{path}.{get_worker_id()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(content, f, indent=4)
+    os.replace(temp_path, path)
+    return
+
+
+def submit_job(queue_path: str, job: Dict[str, Any]) -> str:
+    """Adds a job to the pending jobs of a queue and returns its name. Job
+    names start with the submission time so that jobs are claimed in order
+    """
+    name = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}.json"
+    write_json(os.path.join(queue_path, "pending", name), job)
+    return name
+
+
+def get_claimed_path(queue_path: str, name: str) -> str:
+    """Gets the path a job is moved to when claimed by this worker"""
+    return os.path.join(queue_path, "claimed", f"{name}.{get_worker_id()}")
+
+
+def get_partial_path(output_path: str) -> str:
+    """Gets the path this worker encodes the output of a job to. The output is
+    only moved into place while the worker still holds the claim of the job
+    """
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.{get_worker_id()}.partial{ext}"
+
+
+def claim_job(queue_path: str) -> Union[str, None]:
+    """Attempts to claim the oldest pending job. Returns the name of the job
+    if a job has been claimed, and None if there are no jobs left to claim
+    """
+    pending_dir = os.path.join(queue_path, "pending")
+    for name in sorted(os.listdir(pending_dir)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            # Refresh the lease before the rename so that the job is never
+            # visible in claimed/ with a stale mtime
+            os.utime(os.path.join(pending_dir, name))
+            os.rename(os.path.join(pending_dir, name), get_claimed_path(queue_path, name))
+        except FileNotFoundError:
+            continue   # Another worker claimed the job first
+        return name
+    return None
+
+
+def reclaim_expired_jobs(queue_path: str) -> List[str]:
+    """Moves claimed jobs whose lease has expired back into pending so that
+    jobs of crashed workers are picked up again. Returns the reclaimed jobs
+    """
+    ret = []
+    claimed_dir = os.path.join(queue_path, "claimed")
+    for claimed_name in os.listdir(claimed_dir):
+        if ".json." not in claimed_name:
+            continue
+        name = claimed_name[:claimed_name.index(".json.") + len(".json")]
+        path = os.path.join(claimed_dir, claimed_name)
+        try:
+            if any(os.path.exists(os.path.join(queue_path, status, name)) for status in ["done", "failed"]):
+                # The worker finished the job but crashed before removing its
+                # claim, so the job must not be run again
+                os.remove(path)
+                continue
+            # The claimed path belongs to a single claim of the job, so the
+            # rename can only ever hand back the claim whose lease expired
+            if time.time() - os.path.getmtime(path) < LEASE_SECS:
+                continue
+            os.rename(path, os.path.join(queue_path, "pending", name))
+        except FileNotFoundError:
+            continue   # The job finished or another worker reclaimed it first
+        ret.append(name)
+    return ret
+
+
+class Heartbeat(threading.Thread):
+    """Periodically renews the lease of a claimed job in the background. Once
+    the lease is lost, the running ffmpeg processes are terminated
+    """
+
+    def __init__(
+        self,
+        path: str
+    ) -> None:
+        """Initializes an instance of `Heartbeat`"""
+        super().__init__(daemon=True)
+        self.path = path
+        self.lost = False
+        self._stopped = threading.Event()
+        return
+
+    def renew(self) -> bool:
+        """Touches the claimed job right away. Returns whether the lease is
+        still held
+        """
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            self.lost = True
+        return not self.lost
+
+    def run(self) -> None:
+        """Touches the claimed job until stopped or until the lease is lost"""
+        while not self._stopped.wait(HEARTBEAT_SECS):
+            if self.lost:
+                # Keep terminating in case ffmpeg was about to be started
+                terminate_all()
+                continue
+            if not self.renew():
+                console.print(f" • lost the lease of the job, stopping ffmpeg", style="tan")
+                terminate_all()
+        return
+
+    def stop(self) -> None:
+        """Stops renewing the lease"""
+        self._stopped.set()
+        self.join()
+        return
+
+
+def run_job(queue_path: str, name: str) -> bool:
+    """Runs a claimed job and writes the job along with its results into
+    done/ or failed/. Returns whether the job succeeded
+    """
+    claimed_path = get_claimed_path(queue_path, name)
+    with open(claimed_path) as f:
+        job: Dict[str, Any] = json.load(f)
+
+    reset_terminated()
+    heartbeat = Heartbeat(claimed_path)
+    heartbeat.start()
+    result: Dict[str, Any] = {"worker": get_worker_id(), "started": time.time()}
+    partial_path = get_partial_path(job["output"])
+    try:
+        console.print(f" • worker {get_worker_id()} claimed job '{name}'")
+        options = get_preset_options(job, job["input"], job["output"])
+        result.update(execute(job["input"], partial_path, options, job["backend"]))
+        if job["verify"]:
+            result["verification"] = verify_output(job["input"], partial_path, options, job["verify"], job["samples"], job["backend"])
+            print_report(result["verification"])
+            if not result["verification"]["passed"]:
+                result["error"] = "the output failed verification"
+        # Another worker owns the output once the lease is lost, so the output
+        # is only moved into place while the claim is still held
+        if "error" not in result and heartbeat.renew():
+            os.replace(partial_path, job["output"])
+            result["output"] = job["output"]
+            console.print(f" • moved the output to '{job['output'].lower()}'", style="sea_green3")
+    except FFmpegError as e:
+        if not heartbeat.lost:
+            print_ffmpeg_error(e)
+        result["error"] = e.message
+    except ForceExit as e:
+        result["error"] = e.reason
+    except KeyboardInterrupt:
+        # Hand the job back right away instead of waiting for the lease to expire
+        heartbeat.stop()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        try:
+            os.rename(claimed_path, os.path.join(queue_path, "pending", name))
+        except FileNotFoundError:
+            pass   # The lease was lost and the job has been reclaimed already
+        raise
+    except Exception as e:
+        # A single broken job should not take the whole worker down
+        result["error"] = f"{exception_name(e)}: {str(e).lower()}"
+    heartbeat.stop()
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+    if heartbeat.lost:
+        # The job has been handed to another worker, which owns the result
+        console.print(f" • dropped the result of job '{name}' after losing its lease", style="tan")
+        return False
+
+    result["finished"] = time.time()
+    job["result"] = result
+    status = "failed" if "error" in result else "done"
+    write_json(os.path.join(queue_path, status, name), job)
+    try:
+        os.remove(claimed_path)
+    except FileNotFoundError:
+        pass   # The lease was lost right before the job finished
+    return status == "done"
+
+
+def enqueue(arguments: Dict[str, Any]) -> None:
+    """Submits a conversion to the queue of a cluster"""
+    queue_path = expand_paths(arguments["module"][1])
+    input_path = expand_paths(arguments["module"][2])
+    output_path = expand_paths(arguments["module"][3])
+    for flag in ["resume", "thumbnails", "sprite", "trace"]:
+        if arguments[flag]:
+            raise ArgumentsError(f"'--{flag}' cannot be used when enqueueing jobs", code=126)
+    if not os.path.exists(input_path):
+        raise ForceExit("input path does not exist")
+
+    initialize_queue(queue_path)
+    name = submit_job(queue_path, {
+        "input": input_path,
+        "output": output_path,
+        "preset": arguments["preset"],
+        "plain": arguments["plain"],
+        "verify": arguments["verify"],
+        "samples": arguments["samples"],
+        "backend": arguments["backend"]
+    })
+    console.print(f" • submitted job '{name}' to '{queue_path.lower()}'", style="sea_green3")
+    return
+
+
+def work(arguments: Dict[str, Any]) -> None:
+    """Runs a cluster worker that claims and runs jobs from a queue until
+    the queue is empty. With the '--watch' flag, the worker keeps polling the
+    queue for new jobs instead of exiting
+    """
+    queue_path = expand_paths(arguments["module"][1])
+    initialize_queue(queue_path)
+    console.print(f" • worker {get_worker_id()} watching '{queue_path.lower()}'")
+
+    succeeded = 0
+    failed = 0
+    while True:
+        with trace.span("claim"):
+            for name in reclaim_expired_jobs(queue_path):
+                console.print(f" • reclaimed expired job '{name}'", style="tan")
+            name = claim_job(queue_path)
+        if name is None and not arguments["watch"]:
+            break
+        if name is None:
+            time.sleep(POLL_SECS)
+            continue
+        with trace.span("job", job=name, worker=get_worker_id()):
+            job_succeeded = run_job(queue_path, name)
+        # A worker watching the queue may run for days, so the trace is
+        # written after every job instead of only when the worker exits
+        trace.save()
+        if job_succeeded:
+            succeeded += 1
+        else:
+            failed += 1
+
+    console.print(f" • worker {get_worker_id()} found no more pending jobs", style="sea_green3")
+    console.print(f"    - {succeeded} job(s) succeeded", style="sea_green3")
+    console.print(f"    - {failed} job(s) failed", style="sea_green3")
+    return
@@ -0,0 +1,218 @@
+import os
+import time
+import shutil
+
+from typing import Any, Dict, List
+
+from . import trace
+from .utils import console, readable_size
+from .backend import execute
+from .metadata import Metadata
+from .exceptions import ForceExit
+
+from ffmpeg import FFmpeg
+
+# The stream parameters that have to be identical across every file for the
+# concat demuxer to join them without re-encoding
+VIDEO_PARAMETERS = [
+    "codec_name", "profile", "level", "width", "height", "pix_fmt",
+    "sample_aspect_ratio", "field_order", "time_base"
+]
+AUDIO_PARAMETERS = ["codec_name", "profile", "sample_rate", "channels", "channel_layout", "time_base"]
+
+# Maps the codec names reported by ffprobe to the encoders used when a file
+# has to be re-encoded to match the others. Codecs missing from the map are
+# assumed to share the name of their encoder
+ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+    "vp8": "libvpx",
+    "vp9": "libvpx-vp9",
+    "av1": "libaom-av1",
+    "prores": "prores_ks",
+    "mp3": "libmp3lame",
+    "opus": "libopus",
+    "vorbis": "libvorbis"
+}
+
+# Maps the profiles reported by ffprobe to the profiles of each encoder so
+# that re-encoded files keep the profile of the first input where possible
+PROFILES = {
+    "libx264": {
+        "Constrained Baseline": "baseline",
+        "Baseline": "baseline",
+        "Main": "main",
+        "High": "high",
+        "High 10": "high10",
+        "High 4:2:2": "high422",
+        "High 4:4:4 Predictive": "high444"
+    },
+    "libx265": {"Main": "main", "Main 10": "main10"},
+    "libvpx-vp9": {"Profile 0": "0", "Profile 1": "1", "Profile 2": "2", "Profile 3": "3"},
+    "libaom-av1": {"Main": "main", "High": "high", "Professional": "professional"},
+    "aac": {"LC": "aac_low"}
+}
+LEVEL_ENCODERS = ["libx264"]
+UNKNOWN_LEVEL = -99
+
+
+def write_concat_list(paths: List[str], list_path: str) -> None:
+    """Writes a list of files in the format read by ffmpeg's concat demuxer.
+    Single quotes in the paths are escaped as required by the demuxer
+    """
+    with open(list_path, "w") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return
+
+
+def concat_copy(paths: List[str], output_path: str, list_path: str, backend: str) -> None:
+    """Joins files that share the same codecs and parameters into a single
+    output using the concat demuxer. Streams are copied without re-encoding,
+    so this runs at roughly the speed of the disk
+    """
+    write_concat_list(paths, list_path)
+    instance = (
+        FFmpeg()
+        .option("y")
+        .option("v", "error")
+        .input(list_path, f="concat", safe=0)
+        .output(
+            output_path,
+            {"map": "0", "c": "copy"}
+    ))
+    execute(instance, backend)
+    return
+
+
+def get_signature(metadata: Metadata) -> List[Dict[str, Any]]:
+    """Gets the parameters of the audio and video streams of a file that are
+    relevant to whether it can be joined with other files by stream copying
+    """
+    ret = []
+    for stream in metadata.metadata["streams"]:
+        if stream["codec_type"] == "video":
+            ret.append({"codec_type": "video", **{key: stream.get(key) for key in VIDEO_PARAMETERS}})
+        if stream["codec_type"] == "audio":
+            ret.append({"codec_type": "audio", **{key: stream.get(key) for key in AUDIO_PARAMETERS}})
+    return ret
+
+
+def has_level(stream: Dict[str, Any]) -> bool:
+    """Whether ffprobe reported the level of a stream"""
+    return stream.get("level") is not None and stream["level"] != UNKNOWN_LEVEL
+
+
+def get_matching_options(signature: List[Dict[str, Any]], output_path: str) -> Dict:
+    """Gets the ffmpeg options that re-encode a file into the codecs and the
+    parameters described by the signature, as far as the encoders allow
+    """
+    ret: Dict[str, Any] = {"map": []}
+    video_index = 0
+    audio_index = 0
+    for stream in signature:
+        encoder = ENCODERS.get(stream["codec_name"], stream["codec_name"])
+        profile = PROFILES.get(encoder, {}).get(stream["profile"])
+        if stream["codec_type"] == "video":
+            ret["map"].append(f"0:v:{video_index}")
+            ret[f"c:v:{video_index}"] = encoder
+            video_filter = f"scale={stream['width']}:{stream['height']}"
+            if stream["sample_aspect_ratio"] not in [None, "0:1", "N/A"]:
+                video_filter += f",setsar={stream['sample_aspect_ratio'].replace(':', '/')}"
+            ret[f"filter:v:{video_index}"] = video_filter
+            ret[f"pix_fmt:v:{video_index}"] = stream["pix_fmt"]
+            if profile is not None:
+                ret[f"profile:v:{video_index}"] = profile
+            if has_level(stream) and encoder in LEVEL_ENCODERS:
+                ret[f"level:v:{video_index}"] = f"{stream['level'] / 10:.1f}"
+            video_index += 1
+        if stream["codec_type"] == "audio":
+            ret["map"].append(f"0:a:{audio_index}")
+            ret[f"c:a:{audio_index}"] = encoder
+            ret[f"ar:a:{audio_index}"] = stream["sample_rate"]
+            ret[f"ac:a:{audio_index}"] = stream["channels"]
+            if stream["channel_layout"] is not None:
+                ret[f"filter:a:{audio_index}"] = f"aformat=channel_layouts={stream['channel_layout']}"
+            if profile is not None:
+                ret[f"profile:a:{audio_index}"] = profile
+            audio_index += 1
+
+    # The time base of the video track can only be chosen in mp4/mov outputs
+    video_streams = [stream for stream in signature if stream["codec_type"] == "video"]
+    extension = os.path.splitext(output_path)[1].lower()
+    if video_streams and video_streams[0]["time_base"] and extension in [".mp4", ".m4v", ".mov"]:
+        ret["video_track_timescale"] = video_streams[0]["time_base"].split("/")[1]
+    return ret
+
+
+def join_files(input_paths: List[str], output_path: str, backend: str) -> Dict[str, Any]:
+    """Joins the inputs into the output. If the streams of every input match,
+    the inputs are joined with the concat demuxer without re-encoding.
+    Otherwise every input is re-encoded into a work directory to match the
+    first input before the re-encoded files are joined
+    """
+    with trace.span("probe", inputs=len(input_paths)):
+        signatures = [get_signature(Metadata(path)) for path in input_paths]
+    reference = signatures[0]
+    for path, signature in zip(input_paths, signatures):
+        if [stream["codec_type"] for stream in signature] != [stream["codec_type"] for stream in reference]:
+            raise ForceExit(f"'{os.path.basename(path).lower()}' has a different stream layout from the first input")
+
+    # Files that share the stream parameters can still be encoded with
+    # different settings (e.g. headers of h264 streams), which the decoder
+    # cannot switch between in the middle of a stream. Only pieces encoded
+    # by the same encoder with the same options are safe to join, so every
+    # input is re-encoded as soon as any input differs
+    reencode_all = any(signature != reference for signature in signatures)
+    if reencode_all:
+        console.print(f" • re-encoding every input because the inputs do not match", style="tan")
+
+    start_time = time.time()
+    work_dir = output_path + ".join"
+    os.makedirs(work_dir, exist_ok=True)
+    extension = os.path.splitext(output_path)[1]
+    pieces = []
+    reencoded = 0
+    try:
+        for index, (path, signature) in enumerate(zip(input_paths, signatures)):
+            if not reencode_all:
+                pieces.append(path)
+                continue
+            piece = os.path.join(work_dir, f"piece_{index:05d}{extension}")
+            instance = (
+                FFmpeg()
+                .option("y")
+                .option("v", "error")
+                .input(path)
+                .output(
+                    piece,
+                    get_matching_options(reference, piece)
+            ))
+            with trace.span("re-encode piece", input=path):
+                execute(instance, backend)
+            pieces.append(piece)
+            reencoded += 1
+
+        with trace.span("concat", pieces=len(pieces)):
+            concat_copy(pieces, output_path, os.path.join(work_dir, "pieces.txt"), backend)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if not os.path.exists(output_path):
+        raise ForceExit("ffmpeg did not produce any output files", code=255)
+    return {
+        "output": output_path,
+        "seconds": round(time.time() - start_time, 2),
+        "size": os.path.getsize(output_path),
+        "reencoded": reencoded
+    }
+
+
+def print_join_result(result: Dict[str, Any], inputs: int) -> None:
+    """Prints the summary of a join to the console"""
+    console.print(f" • successfully joined {inputs} files", style="sea_green3")
+    console.print(f"    - took {result['seconds']} seconds", style="sea_green3")
+    console.print(f"    - re-encoded {result['reencoded']} of {inputs} files", style="sea_green3")
+    console.print(f"    - took {readable_size(result['output'])} of space", style="sea_green3")
+    console.print(f"    - output file saved to '{result['output'].lower()}'", style="sea_green3")
+    return
@@ -0,0 +1,105 @@
+import json
+
+from typing import Tuple
+
+from ffmpeg import FFmpeg
+
+
+class Metadata:
+    """The MetadataManager() class represents a media's metadata"""
+
+    def __init__(
+        self,
+        input_path: str,
+    ) -> None:
+        """Initializes an instance of `MediaManager`"""
+        self.video_stream = None
+        self.metadata = {}
+
+        self.input_path = input_path
+        self.get_metadata()
+        return
+
+    def get_metadata(
+        self,
+    ) -> None:
+        """Gets the metadata of the media file that the object is
+        currently representing. This method also loads the audio_stream
+        and video_stream attributes, which represents the first
+        video/audio stream the program encounters
+        """
+        ffprobe_instance = FFmpeg(executable="ffprobe").input(
+            self.input_path,
+            print_format='json',
+            show_streams=None,
+            show_format=None
+        )
+
+        self.metadata: dict = json.loads(ffprobe_instance.execute())
+        self.video_stream = self.get_video_stream()
+        return
+
+    def get_video_stream(self) -> int:
+        """Gets the index of the first video stream in self.metadata. If
+        multiple streams are present, the first stream is returned, and
+        the rest of the streams are ignored
+        
+        If no video streams are present in the metadata, the function 
+        returns -1. 
+        """
+        ret: int = -1
+        for stream in self.metadata["streams"]:
+            if stream["codec_type"] == "video":
+                ret = stream["index"]
+                break
+        return ret
+
+    def get_total_secs(self) -> int:
+        """Gets the total length (in seconds) of the first video stream"""
+        ret = self.metadata["streams"][self.video_stream]["duration"]
+        ret = float(ret)
+        return int(ret)
+
+    def get_duration(self) -> float:
+        """Gets the precise length (in seconds) of the media. The duration
+        of the first video stream is preferred, but some containers (e.g.
+        mkv) only store the duration on the format itself, in which case the
+        format duration is used instead
+        """
+        if self.video_stream != -1:
+            stream = self.metadata["streams"][self.video_stream]
+            if "duration" in stream:
+                return float(stream["duration"])
+        return float(self.metadata.get("format", {}).get("duration", 0.0))
+
+    def get_resolution(self) -> Tuple[int, int]:
+        """Gets the width and height of the first video stream. Returns
+        (0, 0) if no video streams are present in the metadata
+        """
+        if self.video_stream == -1:
+            return (0, 0)
+        stream = self.metadata["streams"][self.video_stream]
+        return (int(stream["width"]), int(stream["height"]))
+
+    def get_framerate(self) -> int:
+        """Gets the average framerate of the first video stream. Because
+        the framerate is stored as a fraction in ffprobe, and some
+        framerate are not whole numbers, this method has to manually parse
+        the framerate by doing division in order to get the framerate as a
+        floating-point integer
+        """
+        fps: str = self.metadata["streams"][self.video_stream]["avg_frame_rate"]
+
+        numerator = ""
+        for _ in range(len(fps)):
+            if fps[0] != "/":
+                numerator += fps[0]
+                fps = fps[1:]
+                continue
+            fps = fps[1:]
+            break
+
+        denominator = fps
+        numerator = float(numerator)
+        denominator = float(denominator)
+        return int(numerator // denominator)
@@ -1,19 +1,26 @@
 import os
 import time
-import json
 
 from typing import List, Dict, Any, Union
 
+from . import trace
 from .utils import NamedPreset, UnnamedPreset, console, MODULE_PATH
-from .utils import readable_size, load_config, expand_paths, open_file
+from .utils import load_config, expand_paths, open_file, create_progress_bar, print_summary
 from .utils import __version__, get_platform_version, get_python_version
+from .analysis import apply_analysis
+from .backend import run, get_frame, execute_ffmpeg
+from .concat import join_files, print_join_result
+from .metadata import Metadata
+from .resume import execute_resumable
+from .thumbnails import create_thumbnails, default_directory
+from .verify import verify_output, print_report
 from .exceptions import ForceExit
 
-from rich.progress import TaskProgressColumn, TextColumn
-from rich.progress import BarColumn, TimeRemainingColumn
-from rich.progress import Progress as ProgressBar
+from ffmpeg import FFmpeg, FFmpegError
 
-from ffmpeg import FFmpeg, FFmpegError, Progress
+# Options that copy the video stream. Copied segments can only be cut at
+# keyframes, so they cannot be converted in segments by '--resume'
+COPY_OPTIONS = ["c", "c:v", "codec", "codec:v", "vcodec"]
 
 
 def help() -> None:
@@ -43,84 +50,6 @@ def config() -> None:
     return
 
 
-class Metadata:
-    """The MetadataManager() class represents a media's metadata"""
-
-    def __init__(
-        self,
-        input_path: str,
-    ) -> None:
-        """Initializes an instance of `MediaManager`"""
-        self.video_stream = None
-        self.metadata = {}
-
-        self.input_path = input_path
-        self.get_metadata()
-        return
-
-    def get_metadata(
-        self,
-    ) -> None:
-        """Gets the metadata of the media file that the object is
-        currently representing. This method also loads the audio_stream
-        and video_stream attributes, which represents the first
-        video/audio stream the program encounters
-        """
-        ffprobe_instance = FFmpeg(executable="ffprobe").input(
-            self.input_path,
-            print_format='json',
-            show_streams=None
-        )
-
-        self.metadata: dict = json.loads(ffprobe_instance.execute())
-        self.video_stream = self.get_video_stream()
-        return
-
-    def get_video_stream(self) -> int:
-        """Gets the index of the first video stream in self.metadata. If
-        multiple streams are present, the first stream is returned, and
-        the rest of the streams are ignored
-        
-        If no video streams are present in the metadata, the function 
-        returns -1. 
-        """
-        ret: int = -1
-        for stream in self.metadata["streams"]:
-            if stream["codec_type"] == "video":
-                ret = stream["index"]
-                break
-        return ret
-
-    def get_total_secs(self) -> int:
-        """Gets the total length (in seconds) of the first video stream"""
-        ret = self.metadata["streams"][self.video_stream]["duration"]
-        ret = float(ret)
-        return int(ret)
-
-    def get_framerate(self) -> int:
-        """Gets the average framerate of the first video stream. Because
-        the framerate is stored as a fraction in ffprobe, and some
-        framerate are not whole numbers, this method has to manually parse
-        the framerate by doing division in order to get the framerate as a
-        floating-point integer
-        """
-        fps: str = self.metadata["streams"][self.video_stream]["avg_frame_rate"]
-
-        numerator = ""
-        for _ in range(len(fps)):
-            if fps[0] != "/":
-                numerator += fps[0]
-                fps = fps[1:]
-                continue
-            fps = fps[1:]
-            break
-
-        denominator = fps
-        numerator = float(numerator)
-        denominator = float(denominator)
-        return int(numerator // denominator)
-    
-
 def parse_custom_command(commands: str) -> Dict:
     """Parses the custom commands that presets"""
     ret: Dict[str, Any] = {}
@@ -167,34 +96,40 @@ def get_named_command(presets: List[NamedPreset], name: str) -> Union[NamedPrese
     return None
 
 
-def convert(arguments: Dict[str, Any]) -> None:
-    """High level logic for the conversion"""
-    config = load_config()
+def check_resumable(options: Dict, analysis: Dict[str, str]) -> None:
+    """Raises if a preset cannot be converted in segments by '--resume'"""
+    if "pass" in options or "two-pass" in analysis:
+        raise ForceExit("two-pass presets cannot be used with '--resume'")
+    if any(options.get(key) == "copy" for key in COPY_OPTIONS):
+        raise ForceExit("presets that copy the video stream cannot be used with '--resume'")
+    return
+
+
+def get_preset_options(arguments: Dict[str, Any], input_path: str, output_path: str, resume: bool = False) -> Dict:
+    """Resolves the preset to use for a conversion according to the '--plain'
+    and '--preset' flags and the config file, and returns its parsed options.
+    With `resume`, presets that cannot be resumed are rejected before their
+    analysis passes run
+    """
+    with trace.span("load config"):
+        config = load_config()
     named_presets = config[0]
     unnamed_presets = config[1]
 
-    input_path = expand_paths(arguments["module"][0])
-    output_path = expand_paths(arguments["module"][1])
-
-    if not os.path.exists(input_path):
-        raise ForceExit("input path does not exist")
-    if os.path.exists(output_path):
-        console.print(f" • specified output path already exists", style="tan")
-        console.print(f" > would you like to override the file? (Y/n) ", style="tan", end="")
-        affirm = input()
-        if not affirm == "Y":
-            raise ForceExit("user terminated operation")
-        
     preset: Union[NamedPreset, UnnamedPreset, None] = None
     if not arguments["plain"]:
         if get_named_command(named_presets, arguments["preset"]) != None and not preset:
             preset = get_named_command(named_presets, arguments["preset"])
             console.print(f" • using matching named preset '{preset.name}'") # type: ignore
             console.print(f" • options applied: '{preset.options}'")  # type: ignore
+            if preset.analysis: # type: ignore
+                console.print(f" • analysis passes: {', '.join(preset.analysis)}") # type: ignore
         if get_unnamed_command(unnamed_presets, input_path, output_path) != None and not preset:
             preset = get_unnamed_command(unnamed_presets, input_path, output_path)
             console.print(f" • using matching unnamed preset ({input_path.split('.')[1]} to {output_path.split('.')[1]})") # type: ignore
             console.print(f" • options applied: '{preset.options}'") # type: ignore
+            if preset.analysis: # type: ignore
+                console.print(f" • analysis passes: {', '.join(preset.analysis)}") # type: ignore
         if not preset:
             preset = UnnamedPreset()
             console.print(f" • using default preset because no matching presets were found")
@@ -204,22 +139,114 @@ def convert(arguments: Dict[str, Any]) -> None:
         console.print(f" • using default preset because '--plain' flag is used")
         console.print(f" • no options will be used in the default preset")
     options: Dict = parse_custom_command(preset.options)
+    if resume:
+        check_resumable(options, preset.analysis)
+    if preset.analysis:
+        options = apply_analysis(input_path, options, preset.analysis)
+    return options
+
+
+def print_ffmpeg_error(e: FFmpegError) -> None:
+    """Prints an error raised by ffmpeg along with some common pitfalls"""
+    console.print(f" • mpeg-convert received an ffmpeg_error", style="red")
+    console.print(f"    - error message from ffmpeg: '{e.message.lower()}'", style="red")
+    console.print(f"    - common pitfalls when using ffmpeg/mpeg-convert: ", style="red")
+    console.print(f"       * does the output file have an extension? ", style="red")
+    console.print(f"       * does the extension match the codec? ", style="red")
+    console.print(f"       * is the encoder installed on the system?", style="red")
+    return
+
+
+def confirm_override(output_path: str) -> None:
+    """Asks the user whether an existing output file should be overridden"""
+    if os.path.exists(output_path):
+        console.print(f" • specified output path already exists", style="tan")
+        console.print(f" > would you like to override the file? (Y/n) ", style="tan", end="")
+        affirm = input()
+        if not affirm == "Y":
+            raise ForceExit("user terminated operation")
+    return
+
+
+def convert(arguments: Dict[str, Any]) -> None:
+    """High level logic for the conversion"""
+    input_path = expand_paths(arguments["module"][0])
+    output_path = expand_paths(arguments["module"][1])
+
+    if not os.path.exists(input_path):
+        raise ForceExit("input path does not exist")
+    backend = arguments["backend"]
+    confirm_override(output_path)
+    try:
+        options = get_preset_options(arguments, input_path, output_path, bool(arguments["resume"]))
+        with trace.span("convert", input=input_path, output=output_path):
+            if arguments["resume"]:
+                execute_resumable(input_path, output_path, options, arguments["resume"], backend)
+            else:
+                execute(input_path, output_path, options, backend)
+    except FFmpegError as e:
+        print_ffmpeg_error(e)
+        raise ForceExit("there was an error with ffmpeg", code=1)
+
+    if arguments["verify"]:
+        with trace.span("verify"):
+            verify(input_path, output_path, options, arguments)
+    if arguments["thumbnails"]:
+        with trace.span("thumbnails"):
+            create_thumbnails(output_path, default_directory(output_path), arguments)
+
+
+def verify(input_path: str, output_path: str, options: Dict, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Verifies the output of a conversion according to the '--verify' and
+    '--samples' flags. Returns the report of the verification
+    """
+    report = verify_output(input_path, output_path, options, arguments["verify"], arguments["samples"], arguments["backend"])
+    print_report(report)
+    if not report["passed"]:
+        raise ForceExit("the output failed verification", code=1)
+    return report
+
+
+def join(arguments: Dict[str, Any]) -> None:
+    """Joins multiple inputs into a single output, re-encoding the inputs only
+    if they cannot be stream copied alongside each other
+    """
+    input_paths = [expand_paths(path) for path in arguments["module"][1:-1]]
+    output_path = expand_paths(arguments["module"][-1])
+    for input_path in input_paths:
+        if not os.path.exists(input_path):
+            raise ForceExit(f"input path '{input_path.lower()}' does not exist")
+    confirm_override(output_path)
 
     try:
-        execute(input_path, output_path, options)
+        with trace.span("join", inputs=len(input_paths)):
+            result = join_files(input_paths, output_path, arguments["backend"])
     except FFmpegError as e:
-        console.print(f" • mpeg-convert received an ffmpeg_error", style="red")
-        console.print(f"    - error message from ffmpeg: '{e.message.lower()}'", style="red")
-        console.print(f"    - common pitfalls when using ffmpeg/mpeg-convert: ", style="red")
-        console.print(f"       * does the output file have an extension? ", style="red")
-        console.print(f"       * does the extension match the codec? ", style="red")
-        console.print(f"       * is the encoder installed on the system?", style="red")
+        print_ffmpeg_error(e)
         raise ForceExit("there was an error with ffmpeg", code=1)
+    print_join_result(result, len(input_paths))
+    return
+
 
+def thumbnails(arguments: Dict[str, Any]) -> None:
+    """Generates thumbnails and sprite sheets of a media file without
+    converting it
+    """
+    input_path = expand_paths(arguments["module"][1])
+    output_dir = expand_paths(arguments["module"][2])
+    if not os.path.exists(input_path):
+        raise ForceExit("input path does not exist")
+    with trace.span("thumbnails"):
+        create_thumbnails(input_path, output_dir, arguments)
+    return
 
-def execute(input_path: str, output_path: str, options: Dict) -> None:
-    """Execution of a conversion with an input path, output path, and an options dict"""
-    metadata = Metadata(input_path)
+
+def execute(input_path: str, output_path: str, options: Dict, backend: str = "ffmpeg") -> Dict[str, Any]:
+    """Execution of a conversion with an input path, output path, and an options dict.
+    Returns a summary of the conversion (time taken and size of the output)
+    """
+    with trace.span("probe", input=input_path):
+        metadata = Metadata(input_path)
     framerate = None
     total_secs = None
     total_frame = None
@@ -243,39 +270,31 @@ def execute(input_path: str, output_path: str, options: Dict) -> None:
     ))
 
     last_frame = 0
+    started = False
     start_time = time.time()
-    with ProgressBar(
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TaskProgressColumn(
-            text_format="[progress.percentage]{task.percentage:>0.1f}% ({task.completed}/{task.total} frames)"),
-        TextColumn("eta", style="cyan"),
-        TimeRemainingColumn(elapsed_when_finished=True),
-        console=console,
-        transient=True
-    ) as bar:
-        @instance.on("progress")
-        def show_prog(progress: Progress) -> None:
-            nonlocal last_frame
+    with create_progress_bar("frames") as bar:
+        def show_prog(frame: int) -> None:
+            nonlocal last_frame, started
+            if not started:
+                trace.instant("first progress")
+                started = True
             bar.update(task, total=total_frame)
-            bar.update(task, advance=progress.frame - last_frame)
-            last_frame = progress.frame
+            bar.update(task, advance=frame - last_frame)
+            last_frame = frame
 
         task = bar.add_task("[sea_green3] • transcoding file...", total=None)
-        instance.execute()
-
-    if not os.path.exists(output_path):
-        console.print(f" • failed executing mpeg-convert", style="red")
-        console.print(f"    - no output detected with ffmpeg", style="red")
-        console.print(f"    - are you sure the preset is valid?", style="red")
-        raise ForceExit("ffmpeg did not produce any output files", code=255)
-
-    total_time = round(time.time() - start_time, 2)
-    total_space = readable_size(output_path)
-    console.print(f" • successfully executed mpeg-convert", style="sea_green3")
-    console.print(f"    - took {total_time} seconds", style="sea_green3")
-    console.print(f"    - took {total_space} of space", style="sea_green3")
-    console.print(f"    - output file saved to '{output_path.lower()}'", style="sea_green3")
-
-
-
+        with trace.span("encode"):
+            if backend == "pipe":
+                run(instance, lambda progress: show_prog(get_frame(progress)))
+            else:
+                instance.on("start", lambda arguments: trace.instant("spawn ffmpeg", arguments=arguments))
+                instance.on("progress", lambda progress: show_prog(progress.frame))
+                execute_ffmpeg(instance)
+
+    with trace.span("finalize"):
+        if not os.path.exists(output_path):
+            console.print(f" • failed executing mpeg-convert", style="red")
+            console.print(f"    - no output detected with ffmpeg", style="red")
+            console.print(f"    - are you sure the preset is valid?", style="red")
+            raise ForceExit("ffmpeg did not produce any output files", code=255)
+    return print_summary(output_path, start_time)
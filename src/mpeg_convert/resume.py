@@ -0,0 +1,145 @@
+import os
+import math
+import json
+import time
+import shutil
+
+from typing import Any, Dict, List, Union
+
+from . import trace
+from .utils import console, create_progress_bar, print_summary
+from .concat import concat_copy
+from .backend import execute
+from .metadata import Metadata
+from .exceptions import ForceExit
+
+from ffmpeg import FFmpeg
+
+
+def get_work_dir(output_path: str) -> str:
+    """Gets the directory segments of a resumable conversion are stored in"""
+    return output_path + ".parts"
+
+
+def get_fingerprint(input_path: str, options: Dict, segment_secs: int) -> Dict[str, Any]:
+    """Gets the values that must not change between runs for the completed
+    segments of a previous run to be reused
+    """
+    return {
+        "input": input_path,
+        "size": os.path.getsize(input_path),
+        "mtime": os.path.getmtime(input_path),
+        "options": options,
+        "segment_secs": segment_secs
+    }
+
+
+def load_manifest(work_dir: str, fingerprint: Dict[str, Any]) -> Dict[str, Any]:
+    """Loads the manifest of a previous run from the work directory. If there
+    is no manifest, or the manifest belongs to a different conversion, the
+    work directory is cleared and an empty manifest is returned
+    """
+    manifest_path = os.path.join(work_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["fingerprint"] == fingerprint:
+            return manifest
+        console.print(f" • discarding segments of a previous run with different settings", style="tan")
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    return {"fingerprint": fingerprint, "completed": []}
+
+
+def save_manifest(work_dir: str, manifest: Dict[str, Any]) -> None:
+    """Saves the manifest atomically so that an interruption never leaves a
+    partially written manifest behind
+    """
+    manifest_path = os.path.join(work_dir, "manifest.json")
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return
+
+
+def get_segment_count(metadata: Metadata, segment_secs: int) -> int:
+    """Gets the number of segments the input is split into. A trailing piece
+    shorter than a single frame is folded into the previous segment instead
+    of being encoded as a (practically empty) segment of its own
+    """
+    duration = metadata.get_duration()
+    try:
+        frame_secs = 1 / metadata.get_framerate()
+    except ZeroDivisionError:
+        frame_secs = 0.1   # Inputs without a video stream have no frames
+    total = math.ceil(duration / segment_secs)
+    if total > 1 and duration - (total - 1) * segment_secs < frame_secs:
+        total -= 1
+    return total
+
+
+def encode_segment(input_path: str, output_path: str, options: Dict, start: float, length: Union[float, None], backend: str) -> None:
+    """Encodes a single time slice of the input, or everything from `start`
+    to the end if the length is None. The segment is written to a temporary
+    file first and only renamed into place once it is complete
+    """
+    root, ext = os.path.splitext(output_path)
+    partial_path = f"{root}.partial{ext}"
+    input_options = {"ss": f"{start:.3f}"}
+    if length is not None:
+        input_options["t"] = f"{length:.3f}"
+    instance = (
+        FFmpeg()
+        .option("y")
+        .input(input_path, input_options)
+        .output(
+            partial_path,
+            dict(options)
+    ))
+    execute(instance, backend)
+    os.replace(partial_path, output_path)
+    return
+
+
+def execute_resumable(input_path: str, output_path: str, options: Dict, segment_secs: int, backend: str) -> Dict[str, Any]:
+    """Execution of a conversion in time-sliced segments. Completed segments
+    are recorded in a manifest inside the work directory, so running the same
+    conversion again after an interruption continues from the last completed
+    segment. The segments are joined into the output once all of them are done
+    """
+    metadata = Metadata(input_path)
+    if metadata.get_duration() <= 0:
+        raise ForceExit("cannot determine the duration of the input")
+
+    work_dir = get_work_dir(output_path)
+    manifest = load_manifest(work_dir, get_fingerprint(input_path, options, segment_secs))
+    total = get_segment_count(metadata, segment_secs)
+    ext = os.path.splitext(output_path)[1]
+    segments: List[str] = [os.path.join(work_dir, f"segment_{index:05d}{ext}") for index in range(total)]
+
+    if manifest["completed"]:
+        console.print(f" • resuming with {len(manifest['completed'])} of {total} segments already completed")
+    console.print(f" • segments are saved to '{work_dir.lower()}'")
+    console.print(f" • rerun the same command to resume if interrupted")
+
+    start_time = time.time()
+    with create_progress_bar("segments") as bar:
+        task = bar.add_task("[sea_green3] • transcoding segments...", total=total, completed=len(manifest["completed"]))
+        for index in range(total):
+            if index in manifest["completed"]:
+                continue
+            # The last segment runs to the end of the input, which also
+            # covers a trailing piece folded into it
+            length = segment_secs if index < total - 1 else None
+            with trace.span("encode segment", index=index):
+                encode_segment(input_path, segments[index], options, index * segment_secs, length, backend)
+            manifest["completed"].append(index)
+            save_manifest(work_dir, manifest)
+            bar.update(task, advance=1)
+
+    with trace.span("concat", segments=total):
+        concat_copy(segments, output_path, os.path.join(work_dir, "segments.txt"), backend)
+    if not os.path.exists(output_path):
+        raise ForceExit("ffmpeg did not produce any output files", code=255)
+    shutil.rmtree(work_dir)
+    return print_summary(output_path, start_time)
@@ -0,0 +1,158 @@
+import os
+import math
+import time
+import shutil
+
+from typing import Any, Dict, List, Tuple
+
+from . import trace
+from .utils import console, expand_paths
+from .backend import execute, execute_all
+from .metadata import Metadata
+from .arguments import DEFAULT_THUMBNAILS, DEFAULT_SPRITE
+from .exceptions import ForceExit
+
+from ffmpeg import FFmpeg, FFmpegError
+
+# The width (in pixels) of a single thumbnail in a sprite sheet. The height
+# is derived from the display aspect ratio of the source video: frames are
+# rotated by ffmpeg (autorotate) and stretched to square pixels before being
+# scaled, so portrait and anamorphic videos keep their proportions
+THUMBNAIL_WIDTH = 160
+THUMBNAIL_FILTER = f"scale=iw*sar:ih,scale={THUMBNAIL_WIDTH}:-2,setsar=1"
+
+
+def format_timestamp(seconds: float) -> str:
+    """Formats a number of seconds as a WebVTT timestamp (hh:mm:ss.mmm)"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def frame_instance(input_path: str, timestamp: float, output_path: str) -> FFmpeg:
+    """Gets an ffmpeg instance that extracts a single frame near the timestamp
+    into an image. Only keyframes are decoded (-skip_frame nokey) and the
+    input is seeked directly to the keyframe preceding the timestamp, so no
+    other frames have to be decoded
+    """
+    instance = (
+        FFmpeg()
+        .option("y")
+        .option("v", "error")
+        .input(
+            input_path,
+            skip_frame="nokey",
+            noaccurate_seek=None,
+            ss=f"{timestamp:.3f}")
+        .output(
+            output_path,
+            {"frames:v": 1, "vf": THUMBNAIL_FILTER, "q:v": 5}
+    ))
+    return instance
+
+
+def tile_frames(frame_pattern: str, start: int, output_path: str, layout: Tuple[int, int], backend: str) -> None:
+    """Tiles up to columns * rows consecutive frames (starting at the frame
+    numbered `start`) into a single sprite sheet
+    """
+    instance = (
+        FFmpeg()
+        .option("y")
+        .option("v", "error")
+        .input(frame_pattern, start_number=start)
+        .output(
+            output_path,
+            {"frames:v": 1, "vf": f"tile={layout[0]}x{layout[1]}", "q:v": 5}
+    ))
+    with trace.span("tile sprite", start=start):
+        execute(instance, backend)
+    return
+
+
+def write_index(path: str, cues: List[Tuple[float, float, str]]) -> None:
+    """Writes a WebVTT index mapping each time range to a region of a sprite"""
+    with open(path, "w") as f:
+        f.write("WEBVTT\n\n")
+        for start, end, target in cues:
+            f.write(f"{format_timestamp(start)} --> {format_timestamp(end)}\n")
+            f.write(f"{target}\n\n")
+    return
+
+
+def generate(input_path: str, output_dir: str, count: int, layout: Tuple[int, int], backend: str) -> Dict[str, Any]:
+    """Generates `count` evenly spaced thumbnails of the input, tiles them into
+    sprite sheets, and writes a WebVTT index (thumbnails.vtt) describing the
+    sprites into the output directory. Frames are extracted in parallel
+    """
+    metadata = Metadata(input_path)
+    duration = metadata.get_duration()
+    width, _ = metadata.get_resolution()
+    if width == 0 or duration <= 0:
+        raise ForceExit("cannot generate thumbnails for media without a video stream")
+
+    interval = duration / count
+    frames_dir = os.path.join(output_dir, "frames")
+    os.makedirs(frames_dir, exist_ok=True)
+
+    start_time = time.time()
+    frame_pattern = os.path.join(frames_dir, "%05d.jpg")
+    instances = [
+        frame_instance(input_path, (index + 0.5) * interval, frame_pattern % index)
+        for index in range(count)
+    ]
+    try:
+        for error in execute_all(instances, backend):
+            if error is not None:
+                raise error
+
+        # The size of the tiles is only known once ffmpeg has rotated and
+        # scaled the frames, so it is read back from the first frame
+        size = Metadata(frame_pattern % 0).get_resolution()
+        per_sheet = layout[0] * layout[1]
+        sheets = math.ceil(count / per_sheet)
+        cues = []
+        for sheet in range(sheets):
+            sprite_name = f"sprite_{sheet:03d}.jpg"
+            tile_frames(frame_pattern, sheet * per_sheet, os.path.join(output_dir, sprite_name), layout, backend)
+            for slot in range(min(per_sheet, count - sheet * per_sheet)):
+                index = sheet * per_sheet + slot
+                x = (slot % layout[0]) * size[0]
+                y = (slot // layout[0]) * size[1]
+                target = f"{sprite_name}#xywh={x},{y},{size[0]},{size[1]}"
+                cues.append((index * interval, (index + 1) * interval, target))
+        write_index(os.path.join(output_dir, "thumbnails.vtt"), cues)
+    finally:
+        shutil.rmtree(frames_dir, ignore_errors=True)
+    return {
+        "count": count,
+        "sprites": sheets,
+        "seconds": round(time.time() - start_time, 2),
+        "directory": output_dir
+    }
+
+
+def create_thumbnails(input_path: str, output_dir: str, arguments: Dict[str, Any]) -> None:
+    """High level logic for generating thumbnails and sprite sheets"""
+    count = arguments["thumbnails"] or DEFAULT_THUMBNAILS
+    layout = arguments["sprite"] or DEFAULT_SPRITE
+    console.print(f" • generating {count} thumbnails in {layout[0]}x{layout[1]} sprites")
+    try:
+        result = generate(input_path, output_dir, count, layout, arguments["backend"])
+    except FFmpegError as e:
+        console.print(f" • mpeg-convert received an ffmpeg_error", style="red")
+        console.print(f"    - error message from ffmpeg: '{e.message.lower()}'", style="red")
+        raise ForceExit("there was an error generating thumbnails", code=1)
+    console.print(f" • successfully generated thumbnails", style="sea_green3")
+    console.print(f"    - took {result['seconds']} seconds", style="sea_green3")
+    console.print(f"    - wrote {result['sprites']} sprite sheet(s)", style="sea_green3")
+    console.print(f"    - index saved to '{os.path.join(output_dir, 'thumbnails.vtt').lower()}'", style="sea_green3")
+    return
+
+
+def default_directory(output_path: str) -> str:
+    """Gets the directory thumbnails are saved to when they are generated as an
+    extra output of a conversion (e.g. out.mp4 -> out.thumbnails/)
+    """
+    return expand_paths(os.path.splitext(output_path)[0] + ".thumbnails")
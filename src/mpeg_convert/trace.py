@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import threading
+
+from typing import Any, Deque, Dict, Union
+from collections import deque
+
+from .exceptions import catch
+
+# Spans are recorded as complete events ("ph": "X") of the Chrome trace event
+# format, which can be opened with https://ui.perfetto.dev or chrome://tracing.
+# Tracing is disabled unless `enable()` is called, in which case `span()`
+# returns a shared no-op context manager so that tracing costs next to nothing.
+# Only the last MAX_EVENTS events are kept so that long running processes
+# (e.g. a worker watching a queue) do not grow the trace without bounds
+MAX_EVENTS = 100_000
+_events: Deque[Dict[str, Any]] = deque(maxlen=MAX_EVENTS)
+_threads: Dict[int, str] = {}
+_lock = threading.Lock()
+_path: Union[str, None] = None
+_origin = time.perf_counter()
+
+
+class NullSpan:
+    """A span that records nothing, used when tracing is disabled"""
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *_) -> None:
+        return
+
+
+class Span:
+    """A span of time recorded as a complete event in the trace"""
+
+    def __init__(
+        self,
+        name: str,
+        args: Dict[str, Any]
+    ) -> None:
+        """Initializes an instance of `Span`"""
+        self.name = name
+        self.args = args
+        self.start = 0.0
+        return
+
+    def __enter__(self) -> "Span":
+        self.start = now()
+        return self
+
+    def __exit__(self, *_) -> None:
+        complete(self.name, self.start, **self.args)
+        return
+
+
+NULL_SPAN = NullSpan()
+
+
+def enable(path: str) -> None:
+    """Enables tracing. The trace is written to the path by `save()`"""
+    global _path
+    _path = path
+    return
+
+
+def now() -> float:
+    """Gets the current time as used for the start of spans"""
+    return time.perf_counter()
+
+
+def record(event: Dict[str, Any], tid: Union[int, None] = None) -> None:
+    """Adds an event to the trace, tagging it with the current process and
+    thread so that concurrent jobs and workers show up on separate tracks.
+    A different track can be chosen by specifying `tid`
+    """
+    thread = threading.current_thread()
+    event["cat"] = "mpeg-convert"
+    event["pid"] = os.getpid()
+    event["tid"] = thread.ident if tid is None else tid
+    with _lock:
+        _events.append(event)
+        if tid is None:
+            _threads[thread.ident] = thread.name # type: ignore
+        else:
+            _threads[tid] = f"process {tid}"
+    return
+
+
+def complete(name: str, start: float, tid: Union[int, None] = None, **args: Any) -> None:
+    """Records a span that started at `start` (see `now()`) and ends now"""
+    if _path is None:
+        return
+    end = now()
+    record({
+        "name": name,
+        "ph": "X",
+        "ts": (start - _origin) * 1_000_000,
+        "dur": (end - start) * 1_000_000,
+        "args": args
+    }, tid)
+    return
+
+
+def span(name: str, **args: Any) -> Union[Span, NullSpan]:
+    """Returns a context manager recording a span named `name` with the
+    keyword arguments as its details (shown when the span is selected)
+    """
+    if _path is None:
+        return NULL_SPAN
+    return Span(name, args)
+
+
+def instant(name: str, **args: Any) -> None:
+    """Records an event that happens at a single point in time"""
+    if _path is None:
+        return
+    record({
+        "name": name,
+        "ph": "i",
+        "s": "t",
+        "ts": (now() - _origin) * 1_000_000,
+        "args": args
+    })
+    return
+
+
+@catch(OSError, "an error occurred when writing the trace")
+def save() -> None:
+    """Writes the recorded events to the trace file if tracing is enabled"""
+    if _path is None:
+        return
+    with _lock:
+        metadata = [{
+            "name": "thread_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": {"name": name}
+        } for tid, name in _threads.items()]
+        events = metadata + list(_events)
+    with open(_path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return
@@ -1,11 +1,15 @@
 import os
 import sys
+import time
 import yaml
 import platform
 import subprocess
 
 from yaml import YAMLError
 from rich.console import Console
+from rich.progress import TaskProgressColumn, TextColumn
+from rich.progress import BarColumn, TimeRemainingColumn
+from rich.progress import Progress as ProgressBar
 from typing import Any, Dict, List, Tuple
 from ffmpeg import FFmpeg, FFmpegError
 
@@ -25,6 +29,7 @@ class NamedPreset:
     """Represents a named conversion preset"""
     name: str = ""
     options: str = ""
+    analysis: Dict[str, str] = {}
 
 
 class UnnamedPreset:
@@ -32,6 +37,7 @@ class UnnamedPreset:
     from_type: List[str] = []
     to_type: List[str] = []
     options: str = ""
+    analysis: Dict[str, str] = {}
 
 
 def get_python_version() -> str:
@@ -72,6 +78,17 @@ def expand_paths(path: str) -> str:
     ))
 
 
+def parse_analysis(analysis: Any) -> Dict[str, str]:
+    """Parses the analysis passes of a preset. Analyses can be specified as a
+    list of names, or as a mapping of names to the parameters of each pass
+    """
+    if isinstance(analysis, list):
+        return {str(name): "" for name in analysis}
+    if isinstance(analysis, dict):
+        return {str(name): str(parameters or "") for name, parameters in analysis.items()}
+    raise KeyError("analysis")
+
+
 @catch((YAMLError, KeyError, OSError), "an error occurred when reading presets")
 def load_config() -> Tuple[List[NamedPreset], List[UnnamedPreset]]:
     """Loads user-defined config from a yaml file into a list"""
@@ -84,6 +101,7 @@ def load_config() -> Tuple[List[NamedPreset], List[UnnamedPreset]]:
                 temp = NamedPreset()
                 temp.name = item["name"]
                 temp.options = item["options"]
+                temp.analysis = parse_analysis(item.get("analysis", {}))
                 named.append(temp)
         if "unnamed" in config:
             for item in config["unnamed"]:
@@ -91,6 +109,7 @@ def load_config() -> Tuple[List[NamedPreset], List[UnnamedPreset]]:
                 temp.from_type = item["from-type"]
                 temp.to_type = item["to-type"]
                 temp.options = item["options"]
+                temp.analysis = parse_analysis(item.get("analysis", {}))
                 unnamed.append(temp)
         return (named, unnamed)
 
@@ -122,6 +141,38 @@ def readable_size(path: str, decimal_points=2) -> str:
     return f"{size:.{decimal_points}f} pb"
 
 
+def create_progress_bar(unit: str) -> ProgressBar:
+    """Creates the progress bar shown while converting, which counts the
+    completed `unit` (e.g. frames) of the conversion
+    """
+    return ProgressBar(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        TaskProgressColumn(
+            text_format=f"[progress.percentage]{{task.percentage:>0.1f}}% ({{task.completed}}/{{task.total}} {unit})"),
+        TextColumn("eta", style="cyan"),
+        TimeRemainingColumn(elapsed_when_finished=True),
+        console=console,
+        transient=True
+    )
+
+
+def print_summary(output_path: str, start_time: float) -> Dict[str, Any]:
+    """Prints the summary of a successful conversion that started at
+    `start_time`, and returns the summary
+    """
+    total_time = round(time.time() - start_time, 2)
+    console.print(f" • successfully executed mpeg-convert", style="sea_green3")
+    console.print(f"    - took {total_time} seconds", style="sea_green3")
+    console.print(f"    - took {readable_size(output_path)} of space", style="sea_green3")
+    console.print(f"    - output file saved to '{output_path.lower()}'", style="sea_green3")
+    return {
+        "output": output_path,
+        "seconds": total_time,
+        "size": os.path.getsize(output_path)
+    }
+
+
 @catch(OSError, "an error occurred when initializing files and directories")
 def initialize(arguments: Dict[str, Any]) -> None:
     """Checks terminal integrity and enables debug logging if applicable"""
@@ -0,0 +1,143 @@
+import os
+
+from typing import Any, Dict, List, Tuple, Union
+
+from .utils import console
+from .backend import execute_all
+from .metadata import Metadata
+
+from ffmpeg import FFmpeg, FFmpegError
+
+# The length (in seconds) of a single window decoded by a sampled verification
+WINDOW_SECS = 2.0
+
+# How far apart (in seconds) the durations of the input and the output may be,
+# which leaves room for a few frames or audio packets of padding
+DURATION_TOLERANCE_SECS = 1.0
+
+# Presets using any of these options may legitimately change the duration
+# or drop streams of the output, so those checks are skipped accordingly
+TRIM_OPTIONS = ["t", "to", "ss", "sseof", "frames", "frames:v", "vframes"]
+DROP_OPTIONS = {"vn": "video", "an": "audio", "sn": "subtitle"}
+
+# Only video and audio streams are compared. Subtitles are left out since
+# ffmpeg silently drops subtitles the output format cannot hold (e.g. bitmap
+# subtitles in mp4), and cover art is not counted as a video stream
+CHECKED_TYPES = ["video", "audio"]
+
+# Outputs with these extensions can hold both video and audio, so a missing
+# stream means the conversion lost it. Other outputs (e.g. gif or mp3) can
+# only hold some of the streams of the input
+AV_EXTENSIONS = ["mp4", "mkv", "mov", "webm", "avi", "m4v", "ts", "flv", "mpg", "mpeg", "wmv", "3gp", "ogv"]
+
+
+def get_stream_types(metadata: Metadata, options: Dict) -> List[str]:
+    """Gets the checked types of streams in the metadata, leaving out the
+    types of streams that are dropped by the options
+    """
+    dropped = [DROP_OPTIONS[key] for key in DROP_OPTIONS if key in options]
+    ret = []
+    for stream in metadata.metadata["streams"]:
+        codec_type = stream.get("codec_type", "unknown")
+        if codec_type not in CHECKED_TYPES or codec_type in dropped or codec_type in ret:
+            continue
+        if stream.get("disposition", {}).get("attached_pic"):
+            continue
+        ret.append(codec_type)
+    return sorted(ret)
+
+
+def compare_stream_types(input_types: List[str], output_types: List[str], output_path: str) -> List[str]:
+    """Compares the types of streams in the input and the output. A type of
+    stream is only expected in the output if the output format can hold it
+    """
+    ret = []
+    extension = os.path.splitext(output_path)[1][1:].lower()
+    for codec_type in output_types:
+        if codec_type not in input_types:
+            ret.append(f"output has {codec_type} but the input does not")
+    for codec_type in input_types:
+        if codec_type not in output_types and extension in AV_EXTENSIONS:
+            ret.append(f"input has {codec_type} but the output does not")
+    return ret
+
+
+def get_windows(duration: float, samples: int) -> List[Tuple[float, float]]:
+    """Gets evenly spaced windows (start and length) across the duration"""
+    if duration <= samples * WINDOW_SECS:
+        return [(0.0, duration)]
+    ret = []
+    for index in range(samples):
+        center = (index + 0.5) * duration / samples
+        ret.append((max(0.0, center - WINDOW_SECS / 2), WINDOW_SECS))
+    return ret
+
+
+def window_instance(path: str, window: Union[Tuple[float, float], None]) -> FFmpeg:
+    """Gets an ffmpeg instance that decodes a window of the file (or the whole
+    file if the window is None) and discards the frames
+    """
+    input_options = {} if window is None else {"ss": f"{window[0]:.3f}", "t": f"{window[1]:.3f}"}
+    instance = (
+        FFmpeg()
+        .option("v", "error")
+        .option("xerror")
+        .input(path, input_options)
+        .output("-", f="null")
+    )
+    return instance
+
+
+def verify_output(input_path: str, output_path: str, options: Dict, mode: str, samples: int, backend: str) -> Dict[str, Any]:
+    """Verifies the output of a conversion. The duration and the types of
+    streams of the output are compared against the input (the types only if
+    the options do not map streams themselves), and then the output is decoded:
+    either a sample of short windows decoded in parallel, or the whole file
+    in full mode. Returns a report of the verification
+    """
+    input_metadata = Metadata(input_path)
+    try:
+        output_metadata = Metadata(output_path)
+    except FFmpegError as e:
+        return {"mode": mode, "issues": [f"failed probing the output: {e.message.lower()}"], "passed": False}
+    input_duration = input_metadata.get_duration()
+    output_duration = output_metadata.get_duration()
+    input_types = get_stream_types(input_metadata, options)
+    output_types = get_stream_types(output_metadata, {})
+
+    issues = []
+    if not any(key in options for key in TRIM_OPTIONS) and abs(input_duration - output_duration) > DURATION_TOLERANCE_SECS:
+        issues.append(f"output is {output_duration:.2f}s long but the input is {input_duration:.2f}s long")
+    if "map" not in options:
+        issues.extend(compare_stream_types(input_types, output_types, output_path))
+
+    windows: List[Union[Tuple[float, float], None]] = [None]
+    if mode == "sampled":
+        windows = list(get_windows(output_duration, samples))
+    errors = execute_all([window_instance(output_path, window) for window in windows], backend)
+    for window, error in zip(windows, errors):
+        if error is None:
+            continue
+        where = "the output" if window is None else f"the window at {window[0]:.2f}s"
+        issues.append(f"failed decoding {where}: {error.message.lower()}")
+
+    return {
+        "mode": mode,
+        "windows": len(windows),
+        "duration": {"input": input_duration, "output": output_duration},
+        "streams": {"input": input_types, "output": output_types},
+        "issues": issues,
+        "passed": len(issues) == 0
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Prints the report of a verification to the console"""
+    if report["passed"]:
+        console.print(f" • successfully verified the output", style="sea_green3")
+        console.print(f"    - decoded {report['windows']} window(s) in {report['mode']} mode", style="sea_green3")
+        return
+    console.print(f" • failed verifying the output", style="red")
+    for issue in report["issues"]:
+        console.print(f"    - {issue}", style="red", markup=False)
+    return
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import multiprocessing
+
+import pytest
+
+from mpeg_convert import cluster
+
+
+def make_job(tmp_path, name: str = "input.mp4") -> dict:
+    input_path = tmp_path / name
+    input_path.write_text("input")
+    return {
+        "input": str(input_path),
+        "output": str(tmp_path / f"{name}.out.mp4"),
+        "preset": "",
+        "plain": True,
+        "verify": False,
+        "samples": 8,
+        "backend": "ffmpeg"
+    }
+
+
+def fake_run_job(queue_path: str, name: str) -> bool:
+    """Records which worker ran a job instead of running ffmpeg"""
+    claimed_path = cluster.get_claimed_path(queue_path, name)
+    with open(claimed_path) as f:
+        job = json.load(f)
+    time.sleep(0.01)
+    job["result"] = {"worker": cluster.get_worker_id()}
+    cluster.write_json(os.path.join(queue_path, "done", name), job)
+    os.remove(claimed_path)
+    return True
+
+
+def run_worker(queue_path: str) -> None:
+    cluster.work({"module": ["worker", queue_path], "watch": False})
+    return
+
+
+@pytest.fixture
+def queue(tmp_path):
+    path = str(tmp_path / "queue")
+    cluster.initialize_queue(path)
+    return path
+
+
+def test_workers_claim_every_job_once(queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(cluster, "run_job", fake_run_job)
+    names = [cluster.submit_job(queue, make_job(tmp_path)) for _ in range(40)]
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=run_worker, args=(queue,)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+
+    assert sorted(os.listdir(os.path.join(queue, "done"))) == sorted(names)
+    assert os.listdir(os.path.join(queue, "pending")) == []
+    assert os.listdir(os.path.join(queue, "claimed")) == []
+
+
+def test_expired_claim_is_reclaimed(queue, tmp_path):
+    expired = cluster.submit_job(queue, make_job(tmp_path))
+    fresh = cluster.submit_job(queue, make_job(tmp_path))
+    for name in [expired, fresh]:
+        os.rename(
+            os.path.join(queue, "pending", name),
+            os.path.join(queue, "claimed", f"{name}.crashed-worker")
+        )
+    stale = time.time() - cluster.LEASE_SECS - 1
+    os.utime(os.path.join(queue, "claimed", f"{expired}.crashed-worker"), (stale, stale))
+
+    assert cluster.reclaim_expired_jobs(queue) == [expired]
+    assert os.listdir(os.path.join(queue, "pending")) == [expired]
+    assert os.listdir(os.path.join(queue, "claimed")) == [f"{fresh}.crashed-worker"]
+
+
+def test_finished_claim_is_dropped(queue, tmp_path):
+    name = cluster.submit_job(queue, make_job(tmp_path))
+    os.rename(
+        os.path.join(queue, "pending", name),
+        os.path.join(queue, "claimed", f"{name}.crashed-worker")
+    )
+    cluster.write_json(os.path.join(queue, "done", name), make_job(tmp_path))
+
+    assert cluster.reclaim_expired_jobs(queue) == []
+    assert os.listdir(os.path.join(queue, "pending")) == []
+    assert os.listdir(os.path.join(queue, "claimed")) == []
+
+
+def test_heartbeat_stops_ffmpeg_on_lease_loss(queue, tmp_path, monkeypatch):
+    terminated = []
+    monkeypatch.setattr(cluster, "HEARTBEAT_SECS", 0.01)
+    monkeypatch.setattr(cluster, "terminate_all", lambda: terminated.append(True))
+    name = cluster.submit_job(queue, make_job(tmp_path))
+    assert cluster.claim_job(queue) == name
+
+    heartbeat = cluster.Heartbeat(cluster.get_claimed_path(queue, name))
+    heartbeat.start()
+    time.sleep(0.05)
+    assert not heartbeat.lost and not terminated
+    os.remove(cluster.get_claimed_path(queue, name))
+    time.sleep(0.05)
+    heartbeat.stop()
+    assert heartbeat.lost and terminated
+
+
+def test_lost_lease_leaves_output_alone(queue, tmp_path, monkeypatch):
+    job = make_job(tmp_path)
+    name = cluster.submit_job(queue, job)
+    assert cluster.claim_job(queue) == name
+
+    def fake_execute(input_path, output_path, options, backend):
+        with open(output_path, "w") as f:
+            f.write("output")
+        # Another worker reclaims the job while this worker is encoding
+        os.rename(cluster.get_claimed_path(queue, name), os.path.join(queue, "pending", name))
+        return {}
+
+    monkeypatch.setattr(cluster, "get_preset_options", lambda *_: {})
+    monkeypatch.setattr(cluster, "execute", fake_execute)
+    assert not cluster.run_job(queue, name)
+    assert not os.path.exists(job["output"])
+    assert not os.path.exists(cluster.get_partial_path(job["output"]))
+    assert os.listdir(os.path.join(queue, "pending")) == [name]
+    assert os.listdir(os.path.join(queue, "done")) == []
+
+
+def test_output_is_moved_into_place(queue, tmp_path, monkeypatch):
+    job = make_job(tmp_path)
+    name = cluster.submit_job(queue, job)
+    assert cluster.claim_job(queue) == name
+
+    def fake_execute(input_path, output_path, options, backend):
+        assert output_path == cluster.get_partial_path(job["output"])
+        with open(output_path, "w") as f:
+            f.write("output")
+        return {}
+
+    monkeypatch.setattr(cluster, "get_preset_options", lambda *_: {})
+    monkeypatch.setattr(cluster, "execute", fake_execute)
+    assert cluster.run_job(queue, name)
+    with open(job["output"]) as f:
+        assert f.read() == "output"
+    assert os.listdir(os.path.join(queue, "done")) == [name]
+    assert os.listdir(os.path.join(queue, "claimed")) == []
@@ -0,0 +1,94 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from mpeg_convert import concat
+from mpeg_convert.metadata import Metadata
+
+
+def make_metadata(width: int, profile: str = "High") -> dict:
+    return {"streams": [
+        {
+            "index": 0, "codec_type": "video", "codec_name": "h264", "profile": profile,
+            "level": 30, "width": width, "height": 240, "pix_fmt": "yuv420p",
+            "sample_aspect_ratio": "1:1", "field_order": "progressive", "time_base": "1/12800"
+        },
+        {
+            "index": 1, "codec_type": "audio", "codec_name": "aac", "profile": "LC",
+            "sample_rate": "48000", "channels": 2, "channel_layout": "stereo", "time_base": "1/48000"
+        }
+    ]}
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Replaces ffprobe with canned metadata and records the ffmpeg commands"""
+    probed = {}
+    commands = []
+
+    class FakeMetadata:
+        def __init__(self, path: str) -> None:
+            self.metadata = probed[path]
+
+    def fake_execute(instance, backend):
+        commands.append((instance.arguments, backend))
+        with open(instance.arguments[-1], "w") as f:
+            f.write("output")
+
+    monkeypatch.setattr(concat, "Metadata", FakeMetadata)
+    monkeypatch.setattr(concat, "execute", fake_execute)
+    return probed, commands
+
+
+def test_matching_inputs_are_stream_copied(tmp_path, fake_ffmpeg):
+    probed, commands = fake_ffmpeg
+    inputs = [str(tmp_path / f"part{index}.mp4") for index in range(3)]
+    for path in inputs:
+        probed[path] = make_metadata(320)
+
+    result = concat.join_files(inputs, str(tmp_path / "output.mp4"), "pipe")
+    assert result["reencoded"] == 0
+    assert len(commands) == 1
+    assert commands[0][0][commands[0][0].index("-f") + 1] == "concat"
+    assert commands[0][1] == "pipe"
+    assert not os.path.exists(tmp_path / "output.mp4.join")
+
+
+def test_every_input_is_reencoded_when_any_differs(tmp_path, fake_ffmpeg):
+    probed, commands = fake_ffmpeg
+    inputs = [str(tmp_path / f"part{index}.mp4") for index in range(3)]
+    probed[inputs[0]] = make_metadata(320)
+    probed[inputs[1]] = make_metadata(320)
+    probed[inputs[2]] = make_metadata(640, profile="Main")
+
+    result = concat.join_files(inputs, str(tmp_path / "output.mp4"), "ffmpeg")
+    assert result["reencoded"] == 3
+    reencodes = [arguments for arguments, _ in commands[:-1]]
+    assert [arguments[arguments.index("-i") + 1] for arguments in reencodes] == inputs
+    for arguments in reencodes:
+        assert arguments[arguments.index("-filter:v:0") + 1] == "scale=320:240,setsar=1/1"
+        assert arguments[arguments.index("-profile:v:0") + 1] == "high"
+
+
+def make_clip(path: str, size: str, options: list) -> None:
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=duration=2:size={size}:rate=25",
+        "-f", "lavfi", "-i", "sine=duration=2:sample_rate=48000",
+        "-c:v", "libx264", "-c:a", "aac", "-ac", "2", *options, path
+    ], check=True)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_joined_output_decodes_cleanly(tmp_path):
+    inputs = [str(tmp_path / "part0.mp4"), str(tmp_path / "part1.mp4"), str(tmp_path / "part2.mp4")]
+    make_clip(inputs[0], "320x240", ["-crf", "23"])
+    make_clip(inputs[1], "320x240", ["-crf", "35", "-bf", "0", "-refs", "1"])
+    make_clip(inputs[2], "640x480", ["-profile:v", "main"])
+    output_path = str(tmp_path / "output.mp4")
+
+    concat.join_files(inputs, output_path, "ffmpeg")
+    subprocess.run(["ffmpeg", "-v", "error", "-xerror", "-i", output_path, "-f", "null", "-"], check=True)
+    assert abs(Metadata(output_path).get_duration() - 6.0) < 0.5
@@ -0,0 +1,18 @@
+from mpeg_convert.verify import compare_stream_types
+
+
+def test_streams_the_output_cannot_hold_are_not_expected():
+    assert compare_stream_types(["audio", "video"], ["video"], "output.gif") == []
+    assert compare_stream_types(["audio", "video"], ["audio"], "output.mp3") == []
+
+
+def test_missing_stream_is_flagged():
+    assert compare_stream_types(["audio", "video"], ["video"], "output.mp4") == [
+        "input has audio but the output does not"
+    ]
+
+
+def test_extra_stream_is_flagged():
+    assert compare_stream_types(["audio"], ["audio", "video"], "output.mp3") == [
+        "output has video but the input does not"
+    ]